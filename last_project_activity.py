@@ -1,37 +1,74 @@
 import argparse
+import asyncio
+import csv
 import datetime
 import logging
+import operator
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import random
 import warnings
-from urllib3.exceptions import InsecureRequestWarning
 
 # Suppress all warnings
 warnings.filterwarnings("ignore")
 
-# Specifically suppress the oauth2client warning
-warnings.filterwarnings("ignore", "file_cache is only supported with oauth2client<4.0.0")
-
-# Suppress Google API client warnings
-logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
-
-from google.cloud import resourcemanager_v3
-from google.cloud import storage
+import httpx
+import orjson
+from google.cloud import asset_v1
 from google.oauth2.credentials import Credentials
 from google.auth.exceptions import DefaultCredentialsError
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill
-import googleapiclient.discovery
-from googleapiclient.errors import HttpError
+from google.auth.transport.requests import Request as AuthRequest
+from google.protobuf import field_mask_pb2
+import xlsxwriter
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+COMPUTE_INSTANCES_URL = 'https://compute.googleapis.com/compute/v1/projects/{}/aggregated/instances'
+STORAGE_BUCKETS_URL = 'https://storage.googleapis.com/storage/v1/b'
+STORAGE_OBJECTS_URL = 'https://storage.googleapis.com/storage/v1/b/{}/o'
+SERVICE_USAGE_URL = 'https://serviceusage.googleapis.com/v1/projects/{}/services'
+LOGGING_ENTRIES_URL = 'https://logging.googleapis.com/v2/entries:list'
+
+# Audit log lookback; projects quiet for longer fall through to the
+# per-service probes.
+AUDIT_LOG_WINDOW_DAYS = 90
+
+# Per-API in-flight request budgets, as multiples of --max_workers; at the
+# default of 10 this allows 100 compute, 100 storage and 50 serviceusage/
+# logging requests at once, roughly in line with default API quotas.
+API_CONCURRENCY_WEIGHTS = {
+    'compute.googleapis.com': 10,
+    'storage.googleapis.com': 10,
+    'serviceusage.googleapis.com': 5,
+    'logging.googleapis.com': 5,
+}
+
+RETRYABLE_STATUSES = (429, 500, 503)
+MAX_REQUEST_ATTEMPTS = 5
+
+# Populated on the event loop at the start of each run.
+_api_semaphores = {}
+
+class ApiError(Exception):
+    """HTTP error response from a googleapis REST endpoint."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Find last activity date for GCP projects in a folder.")
     parser.add_argument("folder_id", help="GCP Folder ID")
-    parser.add_argument("--output", default="project_activity.xlsx", help="Output Excel file name")
-    parser.add_argument("--max_workers", type=int, default=10, help="Maximum number of worker threads")
+    parser.add_argument("--output", default="project_activity.xlsx", help="Output file name")
+    parser.add_argument("--format", choices=["xlsx", "csv"], default="xlsx",
+                        help="Output format; csv skips all styling and, with --no-sort, streams rows as they finish")
+    parser.add_argument("--no-sort", action="store_true",
+                        help="Emit rows in completion order instead of sorting by last activity")
+    parser.add_argument("--max_workers", type=int, default=10,
+                        help="Concurrency scale; per-API request budgets are multiples of this (default: 10)")
+    parser.add_argument("--deep-storage-scan", action="store_true",
+                        help="Also probe the newest object in each bucket (one extra request per bucket)")
+    parser.add_argument("--fresh-days", type=int, default=30,
+                        help="Stop probing a project once activity newer than this many days is found (default: 30)")
     return parser.parse_args()
 
 def get_credentials():
@@ -45,50 +82,173 @@ def get_credentials():
         raise
 
 def get_projects_recursive(folder_id, credentials):
-    folders_client = resourcemanager_v3.FoldersClient(credentials=credentials)
-    projects_client = resourcemanager_v3.ProjectsClient(credentials=credentials)
+    # One Cloud Asset Inventory search returns every project under the folder
+    # (subfolders included) in ~500-result pages, instead of two serial RPCs
+    # per folder node of the old depth-first tree walk.
+    client = asset_v1.AssetServiceClient(credentials=credentials)
+    request = asset_v1.SearchAllResourcesRequest(
+        scope=f"folders/{folder_id}",
+        asset_types=["cloudresourcemanager.googleapis.com/Project"],
+        page_size=500,
+        # Only the fields we read; the default response carries display name,
+        # labels, state and more for every project.
+        read_mask=field_mask_pb2.FieldMask(paths=["name", "additionalAttributes"]),
+    )
     projects = []
+    for resource in client.search_all_resources(request=request):
+        attributes = resource.additional_attributes
+        if "projectId" in attributes:
+            projects.append(attributes["projectId"])
+        else:
+            projects.append(resource.name.split('/')[-1])
+    return projects
 
-    def traverse_folder(folder_id):
-        folder_filter = f"parent.type:folder parent.id:{folder_id}"
-        request = resourcemanager_v3.SearchProjectsRequest(query=folder_filter)
-        for project in projects_client.search_projects(request=request):
-            projects.append(project.project_id)
+# Shared headers dict, rebuilt only when the token changes; every in-flight
+# request reuses the same object instead of formatting a header per call.
+_auth_header_cache = {}
 
-        subfolder_request = resourcemanager_v3.ListFoldersRequest(parent=f"folders/{folder_id}")
-        for folder in folders_client.list_folders(request=subfolder_request):
-            traverse_folder(folder.name.split('/')[-1])
+def _auth_headers(credentials):
+    if not credentials.valid:
+        credentials.refresh(AuthRequest())
+    headers = _auth_header_cache.get(credentials.token)
+    if headers is None:
+        _auth_header_cache.clear()
+        headers = {'Authorization': f'Bearer {credentials.token}'}
+        _auth_header_cache[credentials.token] = headers
+    return headers
 
-    traverse_folder(folder_id)
-    return projects
+async def _request_json(session, method, url, headers, **kwargs):
+    # Bound concurrency per API so all (project x probe) pairs can be in
+    # flight at once without tripping a single endpoint's quota.
+    host = url.split('/')[2]
+    semaphore = _api_semaphores.setdefault(host, asyncio.Semaphore(50))
+
+    async with semaphore:
+        for attempt in range(1, MAX_REQUEST_ATTEMPTS + 1):
+            response = await session.request(method, url, headers=headers, **kwargs)
+            if response.status_code in RETRYABLE_STATUSES and attempt < MAX_REQUEST_ATTEMPTS:
+                # Exponential backoff with jitter
+                await asyncio.sleep(min(2 ** attempt, 32) * (0.5 + random.random()))
+                continue
+            if response.status_code >= 400:
+                raise ApiError(response.status_code, response.text)
+            # orjson decodes the large list responses several times faster
+            # than stdlib json and with less transient garbage.
+            return orjson.loads(response.content)
+
+async def _api_get(session, url, params, credentials):
+    return await _request_json(session, 'GET', url, _auth_headers(credentials), params=params)
 
-def check_compute_last_activity(project_id, credentials):
+async def _api_post(session, url, body, credentials):
+    headers = {**_auth_headers(credentials), 'Content-Type': 'application/json'}
+    return await _request_json(session, 'POST', url, headers, content=orjson.dumps(body))
+
+def _is_api_disabled(error):
+    return error.status == 403 and ('accessNotConfigured' in str(error) or 'SERVICE_DISABLED' in str(error))
+
+# Cumulative days before each month in a non-leap year, 1-indexed.
+_DAYS_BEFORE_MONTH = (0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+def _iso_to_epoch_us(value):
+    """Convert an RFC3339 timestamp (trailing 'Z' or '+/-HH:MM') to epoch microseconds.
+
+    The API timestamps have a fixed layout, so fields are read by offset
+    instead of datetime.fromisoformat plus a str.replace per value; inside the
+    per-instance loops this avoids a datetime allocation per timestamp and
+    lets callers compare plain ints.
+    """
+    year = int(value[0:4])
+    month = int(value[5:7])
+    seconds = (int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19]))
+    leap = month > 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    days = ((year - 1970) * 365 + (year - 1969) // 4 - (year - 1901) // 100 + (year - 1601) // 400
+            + _DAYS_BEFORE_MONTH[month] + leap + int(value[8:10]) - 1)
+    seconds += days * 86400
+
+    micros = 0
+    i = 19
+    if i < len(value) and value[i] == '.':
+        j = i + 1
+        while j < len(value) and value[j].isdigit():
+            j += 1
+        micros = int(value[i + 1:j].ljust(6, '0')[:6])
+        i = j
+
+    if i < len(value):
+        if value[i] == '+':
+            seconds -= int(value[i + 1:i + 3]) * 3600 + int(value[i + 4:i + 6]) * 60
+        elif value[i] == '-':
+            seconds += int(value[i + 1:i + 3]) * 3600 + int(value[i + 4:i + 6]) * 60
+
+    return seconds * 1_000_000 + micros
+
+def _epoch_us_to_datetime(epoch_us):
+    return _EPOCH + datetime.timedelta(microseconds=epoch_us)
+
+async def check_audit_log_last_activity(project_id, session, credentials):
     try:
-        compute = googleapiclient.discovery.build('compute', 'v1', credentials=credentials)
-        
-        # Check VM instances
-        request = compute.instances().aggregatedList(project=project_id)
-        response = request.execute()
-        
-        latest_activity = None
-        
-        for zone, instances in response.get('items', {}).items():
-            if 'instances' in instances:
-                for instance in instances['instances']:
-                    # Parse creation timestamp
-                    created = datetime.datetime.fromisoformat(instance['creationTimestamp'].replace('Z', '+00:00'))
-                    if latest_activity is None or created > latest_activity:
-                        latest_activity = created
-                    
-                    # Parse last start timestamp if available
-                    if 'lastStartTimestamp' in instance:
-                        last_start = datetime.datetime.fromisoformat(instance['lastStartTimestamp'].replace('Z', '+00:00'))
-                        if latest_activity is None or last_start > latest_activity:
-                            latest_activity = last_start
-        
-        return latest_activity, None
-    except HttpError as e:
-        if e.resp.status == 403 and 'accessNotConfigured' in str(e):
+        # The newest audit entry answers "when was this project last touched"
+        # directly: one request per project instead of enumerating resources.
+        window_start = (datetime.datetime.now(datetime.timezone.utc)
+                        - datetime.timedelta(days=AUDIT_LOG_WINDOW_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        body = {
+            'resourceNames': [f'projects/{project_id}'],
+            'filter': f'logName:"cloudaudit.googleapis.com" AND timestamp >= "{window_start}"',
+            'orderBy': 'timestamp desc',
+            'pageSize': 1,
+        }
+        response = await _api_post(session, LOGGING_ENTRIES_URL, body, credentials)
+
+        for entry in response.get('entries', []):
+            return _epoch_us_to_datetime(_iso_to_epoch_us(entry['timestamp'])), None
+
+        return None, None
+    except ApiError as e:
+        if _is_api_disabled(e):
+            return None, "API not enabled"
+        logging.debug(f"Error checking audit logs for project {project_id}: {str(e)}")
+        return None, str(e)
+    except Exception as e:
+        logging.debug(f"Error checking audit logs for project {project_id}: {str(e)}")
+        return None, str(e)
+
+async def check_compute_last_activity(project_id, session, credentials, fresh_cutoff_us=None):
+    try:
+        # -1 sentinel instead of None keeps the reduction a plain int max().
+        latest_activity = -1
+
+        # Ask only for the two timestamps we use; the full instance resources
+        # (disks, network interfaces, metadata, ...) are 10-50x larger.
+        params = {
+            'fields': 'items/*/instances(creationTimestamp,lastStartTimestamp),nextPageToken',
+            'maxResults': 500,
+        }
+        while True:
+            response = await _api_get(session, COMPUTE_INSTANCES_URL.format(project_id), params, credentials)
+
+            # Creation and last-start timestamps, reduced with the C-level
+            # max() instead of two Python-level compare branches per instance.
+            latest_activity = max(latest_activity, max(
+                (_iso_to_epoch_us(instance[key])
+                 for zone in response.get('items', {}).values()
+                 for instance in zone.get('instances', [])
+                 for key in ('creationTimestamp', 'lastStartTimestamp')
+                 if key in instance),
+                default=-1))
+
+            # Once activity is newer than the freshness cutoff the verdict
+            # cannot change; skip the remaining pages.
+            if fresh_cutoff_us is not None and latest_activity >= fresh_cutoff_us:
+                break
+            if 'nextPageToken' not in response:
+                break
+            params['pageToken'] = response['nextPageToken']
+
+        return _epoch_us_to_datetime(latest_activity) if latest_activity >= 0 else None, None
+    except ApiError as e:
+        if _is_api_disabled(e):
             return None, "API not enabled"
         logging.debug(f"Error checking compute activity for project {project_id}: {str(e)}")
         return None, str(e)
@@ -96,50 +256,84 @@ def check_compute_last_activity(project_id, credentials):
         logging.debug(f"Error checking compute activity for project {project_id}: {str(e)}")
         return None, str(e)
 
-def check_storage_last_activity(project_id, credentials):
+async def _check_bucket_objects(bucket_name, session, credentials):
+    # One object with only its updated field is enough for an activity signal.
+    blobs = await _api_get(session, STORAGE_OBJECTS_URL.format(bucket_name),
+                           {'fields': 'items(updated),nextPageToken', 'maxResults': 1,
+                            'projection': 'noAcl'}, credentials)
+    for blob in blobs.get('items', []):
+        if 'updated' in blob:
+            return _iso_to_epoch_us(blob['updated'])
+    return None
+
+async def check_storage_last_activity(project_id, session, credentials, deep_scan=False,
+                                      fresh_cutoff_us=None):
     try:
-        client = storage.Client(project=project_id, credentials=credentials)
-        latest_activity = None
-        
-        # Get all buckets
-        buckets = list(client.list_buckets())
-        for bucket in buckets:
-            # Check bucket creation time
-            if latest_activity is None or bucket.time_created > latest_activity:
-                latest_activity = bucket.time_created
-                
-            # Check bucket update time
-            if bucket.updated and (latest_activity is None or bucket.updated > latest_activity):
-                latest_activity = bucket.updated
-                
-            # Check last modified objects (limit to 10 most recent to avoid excessive API calls)
-            blobs = list(client.list_blobs(bucket.name, max_results=10))
-            for blob in blobs:
-                if blob.updated and (latest_activity is None or blob.updated > latest_activity):
-                    latest_activity = blob.updated
-        
-        return latest_activity, None
-    except Exception as e:
-        if 'accessNotConfigured' in str(e):
+        latest_activity = -1
+        bucket_names = []
+
+        # Get all buckets; bucket metadata alone already reflects the last
+        # bucket-level change, so this is one request per page of 250.
+        params = {'project': project_id, 'projection': 'noAcl',
+                  'fields': 'items(name,timeCreated,updated),nextPageToken', 'maxResults': 250}
+        while True:
+            response = await _api_get(session, STORAGE_BUCKETS_URL, params, credentials)
+            buckets = response.get('items', [])
+            # Bucket names are only needed for the opt-in object probe.
+            if deep_scan:
+                bucket_names.extend(bucket['name'] for bucket in buckets)
+
+            # Bucket creation and update times, reduced with the C-level max().
+            latest_activity = max(latest_activity, max(
+                (_iso_to_epoch_us(bucket[key])
+                 for bucket in buckets
+                 for key in ('timeCreated', 'updated')
+                 if key in bucket),
+                default=-1))
+
+            if 'nextPageToken' not in response:
+                break
+            params['pageToken'] = response['nextPageToken']
+
+        # The bucket metadata already proving the project fresh means the
+        # object probe cannot change the verdict.
+        if fresh_cutoff_us is not None and latest_activity >= fresh_cutoff_us:
+            deep_scan = False
+
+        # The per-bucket object probe costs one request per bucket, so it is
+        # opt-in via --deep-storage-scan.
+        if deep_scan and bucket_names:
+            blob_updates = await asyncio.gather(
+                *(_check_bucket_objects(name, session, credentials) for name in bucket_names))
+            latest_activity = max(latest_activity, max(
+                (updated for updated in blob_updates if updated is not None), default=-1))
+
+        return _epoch_us_to_datetime(latest_activity) if latest_activity >= 0 else None, None
+    except ApiError as e:
+        if _is_api_disabled(e):
             return None, "API not enabled"
         logging.debug(f"Error checking storage activity for project {project_id}: {str(e)}")
         return None, str(e)
+    except Exception as e:
+        logging.debug(f"Error checking storage activity for project {project_id}: {str(e)}")
+        return None, str(e)
 
-def check_api_usage_last_activity(project_id, credentials):
+async def check_api_usage_last_activity(project_id, session, credentials):
     try:
-        # Use Service Usage API to check for recent API calls
-        service = googleapiclient.discovery.build('serviceusage', 'v1', credentials=credentials)
-        request = service.services().list(parent=f'projects/{project_id}', filter='state:ENABLED', pageSize=200)
-        response = request.execute()
-        
+        # Use Service Usage API to check for recent API calls; one enabled
+        # service is enough, so ask for a single name-only result.
+        response = await _api_get(session, SERVICE_USAGE_URL.format(project_id),
+                                  {'filter': 'state:ENABLED', 'pageSize': 1,
+                                   'fields': 'services(name),nextPageToken'}, credentials)
+
         if 'services' in response:
             # Just check if services are enabled, as a proxy for activity
             # Unfortunately, the API doesn't provide exact usage timestamps
             return datetime.datetime.now(datetime.timezone.utc), None
-        
+
         return None, None
-    except HttpError as e:
-        if e.resp.status == 403 and 'accessNotConfigured' in str(e):
+    except ApiError as e:
+        if _is_api_disabled(e):
             return None, "API not enabled"
         logging.debug(f"Error checking API usage for project {project_id}: {str(e)}")
         return None, str(e)
@@ -147,143 +341,237 @@ def check_api_usage_last_activity(project_id, credentials):
         logging.debug(f"Error checking API usage for project {project_id}: {str(e)}")
         return None, str(e)
 
-def get_project_last_activity(project_id, credentials):
+async def _refresh_credentials_periodically(credentials):
+    # Re-refresh shortly before each expiry so in-flight probes never block
+    # on the lazy refresh path; credentials.expiry is naive UTC.
+    while True:
+        delay = 300.0
+        if credentials.expiry is not None:
+            remaining = (credentials.expiry.replace(tzinfo=datetime.timezone.utc)
+                         - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+            delay = max(remaining - 300, 30)
+        await asyncio.sleep(delay)
+        await asyncio.get_running_loop().run_in_executor(None, credentials.refresh, AuthRequest())
+
+async def get_project_last_activity(project_id, session, credentials, deep_scan=False,
+                                    fresh_cutoff_us=None):
     try:
         project_info = {"project_id": project_id}
-        
+
         # Initialize with None
         last_activity_date = None
         activity_source = "None"
         access_issues = []
-        
-        # Check different services and find the most recent activity
-        compute_activity, compute_error = check_compute_last_activity(project_id, credentials)
+
+        # A single audit-log lookup answers the question in O(1); fall back to
+        # enumerating resources only when it is disabled or finds nothing.
+        audit_activity, audit_error = await check_audit_log_last_activity(project_id, session, credentials)
+        if audit_activity:
+            project_info["last_activity_date"] = audit_activity
+            project_info["activity_source"] = "Audit Logs"
+            project_info["access_issues"] = None
+            return project_info
+        if audit_error:
+            access_issues.append(f"Logging: {audit_error}")
+
+        # Probe the services concurrently; per-project latency is the max of
+        # the two calls instead of their sum.
+        (compute_activity, compute_error), (storage_activity, storage_error) = \
+            await asyncio.gather(
+                check_compute_last_activity(project_id, session, credentials, fresh_cutoff_us),
+                check_storage_last_activity(project_id, session, credentials, deep_scan, fresh_cutoff_us),
+            )
+
         if compute_error:
             access_issues.append(f"Compute: {compute_error}")
         if compute_activity and (last_activity_date is None or compute_activity > last_activity_date):
             last_activity_date = compute_activity
             activity_source = "Compute Engine"
-        
-        storage_activity, storage_error = check_storage_last_activity(project_id, credentials)
+
         if storage_error:
             access_issues.append(f"Storage: {storage_error}")
         if storage_activity and (last_activity_date is None or storage_activity > last_activity_date):
             last_activity_date = storage_activity
             activity_source = "Cloud Storage"
-        
-        # If we don't have activity from specific services, check for general API usage
+
+        # If we don't have activity from specific services, fall back to
+        # general API usage. Its answer is always now(), which cannot beat a
+        # real timestamp, so the RPC is only issued when nothing else matched.
         if last_activity_date is None:
-            api_activity, api_error = check_api_usage_last_activity(project_id, credentials)
+            api_activity, api_error = await check_api_usage_last_activity(project_id, session, credentials)
             if api_error:
                 access_issues.append(f"API: {api_error}")
             if api_activity:
                 last_activity_date = api_activity
                 activity_source = "API Usage"
-        
+
         # Set the project info
         project_info["last_activity_date"] = last_activity_date
         project_info["activity_source"] = activity_source
         project_info["access_issues"] = "; ".join(access_issues) if access_issues else None
-        
+
         return project_info
     except Exception as e:
         logging.error(f"Error getting last activity for project {project_id}: {str(e)}")
         return {
-            "project_id": project_id, 
-            "last_activity_date": None, 
+            "project_id": project_id,
+            "last_activity_date": None,
             "activity_source": "Error",
             "access_issues": str(e)
         }
 
+async def collect_projects_activity(projects, credentials, max_workers, deep_scan=False,
+                                    fresh_days=None, on_result=None):
+    projects_activity = []
+
+    # Concurrency is bounded per API request rather than per project, so the
+    # scheduler can overlap every (project x probe) pair.
+    _api_semaphores.clear()
+    for host, weight in API_CONCURRENCY_WEIGHTS.items():
+        _api_semaphores[host] = asyncio.Semaphore(weight * max_workers)
+
+    fresh_cutoff_us = None
+    if fresh_days is not None:
+        fresh_cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=fresh_days)
+        fresh_cutoff_us = (fresh_cutoff - _EPOCH) // datetime.timedelta(microseconds=1)
+    # One pooled HTTP/2 client for every probe: the googleapis hosts share a
+    # multiplexed TLS session, so concurrent requests ride existing
+    # connections instead of paying a handshake each.
+    limits = httpx.Limits(max_connections=200, max_keepalive_connections=200, keepalive_expiry=60)
+
+    refresher = asyncio.ensure_future(_refresh_credentials_periodically(credentials))
+    try:
+        async with httpx.AsyncClient(http2=True, limits=limits, timeout=30) as session:
+            async def probe(project_id):
+                return await get_project_last_activity(project_id, session, credentials, deep_scan,
+                                                       fresh_cutoff_us)
+
+            for future in asyncio.as_completed([probe(project_id) for project_id in projects]):
+                result = await future
+                if result:
+                    # Stream completed rows straight to the caller instead of
+                    # buffering when an on_result sink is provided.
+                    if on_result is not None:
+                        on_result(result)
+                    else:
+                        # Precompute the sort key once per project; -1 sorts
+                        # no-activity rows after every real timestamp.
+                        result['_sort_key'] = (int(result['last_activity_date'].timestamp())
+                                               if result['last_activity_date'] else -1)
+                        projects_activity.append(result)
+                    logging.info(f"Processed project {result['project_id']}")
+    finally:
+        refresher.cancel()
+
+    return projects_activity
+
+REPORT_HEADERS = ['Project ID', 'Last Activity Date', 'Activity Source', 'Days Since Activity', 'Access Issues']
+
+def _project_row(project, now):
+    if project['last_activity_date']:
+        activity_date = project['last_activity_date']
+        activity_value = activity_date.strftime('%Y-%m-%d %H:%M:%S')
+        # Calculate days since activity
+        days_since = (now - activity_date).days
+    else:
+        activity_value = "No activity found"
+        days_since = "N/A"
+
+    return [project['project_id'], activity_value, project['activity_source'],
+            days_since, project.get('access_issues') or ""]
+
 def write_to_excel(projects_activity, filename):
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Project Activity"
-
-        # Write headers
-        headers = ['Project ID', 'Last Activity Date', 'Activity Source', 'Days Since Activity', 'Access Issues']
-        for col, header in enumerate(headers, start=1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-
-        # Define color for access issues
-        access_issue_fill = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")  # Light yellow
-        
+        # constant_memory streams each finished row to disk, so memory stays
+        # O(columns) instead of holding the whole sheet.
+        wb = xlsxwriter.Workbook(filename, {'constant_memory': True, 'strings_to_urls': False})
+        ws = wb.add_worksheet("Project Activity")
+
+        header_format = wb.add_format({'bold': True})
+        access_issue_format = wb.add_format({'bg_color': '#FFF2CC'})  # Light yellow
+
+        # Write headers, tracking column widths as we go
+        widths = [len(header) for header in REPORT_HEADERS]
+        for col, header in enumerate(REPORT_HEADERS):
+            ws.write(0, col, header, header_format)
+
         now = datetime.datetime.now(datetime.timezone.utc)
-        
+
         # Write data
-        for row, project in enumerate(projects_activity, start=2):
-            ws.cell(row=row, column=1, value=project['project_id'])
-            
-            if project['last_activity_date']:
-                activity_date = project['last_activity_date']
-                ws.cell(row=row, column=2, value=activity_date.strftime('%Y-%m-%d %H:%M:%S'))
-                
-                # Calculate days since activity
-                days_since = (now - activity_date).days
-                ws.cell(row=row, column=4, value=days_since)
-            else:
-                ws.cell(row=row, column=2, value="No activity found")
-                ws.cell(row=row, column=4, value="N/A")
-                
-            ws.cell(row=row, column=3, value=project['activity_source'])
-            
-            if 'access_issues' in project and project['access_issues']:
-                ws.cell(row=row, column=5, value=project['access_issues'])
-                # Highlight rows with access issues
-                for col in range(1, 6):
-                    ws.cell(row=row, column=col).fill = access_issue_fill
+        for row, project in enumerate(projects_activity, start=1):
+            # Highlight rows with access issues; one row-level format call
+            # covers all cells (must precede the writes in constant_memory
+            # mode).
+            if project.get('access_issues'):
+                ws.set_row(row, None, access_issue_format)
+            for col, value in enumerate(_project_row(project, now)):
+                ws.write(row, col, value)
+                value_len = len(str(value))
+                if value_len > widths[col]:
+                    widths[col] = value_len
 
         # Adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-        wb.save(filename)
+        for col, width in enumerate(widths):
+            ws.set_column(col, col, width + 2)
+
+        wb.close()
         logging.info(f"Results written to {filename}")
     except Exception as e:
         logging.error(f"Error writing to Excel: {str(e)}")
 
+def write_to_csv(projects_activity, filename):
+    try:
+        with open(filename, 'w', newline='', buffering=1 << 20) as f:
+            writer = csv.writer(f)
+            writer.writerow(REPORT_HEADERS)
+            now = datetime.datetime.now(datetime.timezone.utc)
+            for project in projects_activity:
+                writer.writerow(_project_row(project, now))
+        logging.info(f"Results written to {filename}")
+    except Exception as e:
+        logging.error(f"Error writing to CSV: {str(e)}")
+
 def main():
     args = parse_arguments()
-    
+
     try:
         logging.info(f"Searching for projects in folder {args.folder_id}")
-        
+
         credentials = get_credentials()
+        # Refresh once up front so every probe starts with a valid token
+        # instead of the first wave serializing on the lazy refresh.
+        credentials.refresh(AuthRequest())
         projects = get_projects_recursive(args.folder_id, credentials)
         logging.info(f"Found {len(projects)} projects")
-        
+
+        if args.format == "csv" and args.no_sort:
+            # Unsorted CSV needs no buffering at all: stream each row to disk
+            # the moment its project finishes.
+            with open(args.output, 'w', newline='', buffering=1 << 20) as f:
+                writer = csv.writer(f)
+                writer.writerow(REPORT_HEADERS)
+                now = datetime.datetime.now(datetime.timezone.utc)
+                asyncio.run(collect_projects_activity(
+                    projects, credentials, args.max_workers, args.deep_storage_scan, args.fresh_days,
+                    on_result=lambda project: writer.writerow(_project_row(project, now))))
+            logging.info(f"Results written to {args.output}")
+            return
+
         # Get last activity for each project
-        projects_activity = []
-        with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
-            future_to_project = {executor.submit(get_project_last_activity, project_id, credentials): project_id 
-                                 for project_id in projects}
-            
-            for future in as_completed(future_to_project):
-                result = future.result()
-                if result:
-                    projects_activity.append(result)
-                    logging.info(f"Processed project {result['project_id']}")
-        
-        # Sort projects by last activity date (most recent first)
-        projects_activity.sort(key=lambda x: (x['last_activity_date'] is None, 
-                                             x['last_activity_date'] if x['last_activity_date'] else datetime.datetime.min),
-                              reverse=True)
-        
-        write_to_excel(projects_activity, args.output)
-        
+        projects_activity = asyncio.run(collect_projects_activity(projects, credentials, args.max_workers,
+                                                                  args.deep_storage_scan, args.fresh_days))
+
+        if not args.no_sort:
+            # Sort projects by last activity date (most recent first)
+            projects_activity.sort(key=operator.itemgetter('_sort_key'), reverse=True)
+
+        if args.format == "csv":
+            write_to_csv(projects_activity, args.output)
+        else:
+            write_to_excel(projects_activity, args.output)
+
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()